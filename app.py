@@ -1,117 +1,255 @@
-from flask import Flask, request, redirect, url_for, render_template
-import json
+from flask import Flask, Response, request, redirect, url_for, stream_template
+from dataclasses import dataclass
+from functools import lru_cache
 import os
+import secrets
+import sqlite3
+import threading
 
-# Lista global de tareas en memoria
-tareas = []
-ultimo_id = 0
+import orjson
+
+
+@dataclass(slots=True)
+class Tarea:
+    """Una tarea de alguna lista."""
+
+    id: int
+    texto: str
+    completada: bool = False
+    motivo: str = ""
+    inhabilitada: bool = False
+    lista: str = "general"
+    tema: str = ""
+
+
+RUTA_DB = "tareas.db"
+# Archivo JSON usado por versiones anteriores; se importa al crear la base
 RUTA_DATOS = "tareas.json"
 
+# Se guarda en PRAGMA user_version una vez creado el esquema e importado el JSON
+VERSION_ESQUEMA = 1
 
-def cargar_tareas() -> None:
-    """Carga las tareas desde el archivo JSON, si existe."""
-    global tareas, ultimo_id
-    if not os.path.exists(RUTA_DATOS):
-        tareas = []
-        ultimo_id = 0
-        return
+# Columnas en el mismo orden que los campos de Tarea
+_COLUMNAS = "id, texto, completada, motivo, inhabilitada, lista, tema"
+
+# Conexión de escritura compartida; _lock serializa su uso entre hilos (servidor con threads)
+_conexion: sqlite3.Connection | None = None
+_lock = threading.RLock()
+# Cada hilo lee con su propia conexión, así las lecturas no esperan a _lock
+_lecturas = threading.local()
+# Cambia en cada iniciar_db() para que los hilos reabran su conexión de lectura
+_generacion = 0
+
+# Se incrementa en cada modificación hecha por este proceso (ver _version_datos)
+_version = 0
+# Distingue las versiones de este proceso de las de arranques anteriores (ETag)
+_ID_INSTANCIA = secrets.token_hex(4)
 
-    try:
-        with open(RUTA_DATOS, "r", encoding="utf-8") as f:
-            datos = json.load(f)
-    except (json.JSONDecodeError, OSError):
-        tareas = []
-        ultimo_id = 0
+# HTML ya renderizado de las vistas, válido mientras no cambie _version_datos()
+MAX_VISTAS_CACHEADAS = 128
+_cache_html_listas: tuple[tuple[int, int], str] | None = None
+_cache_html_tareas: dict[str, tuple[tuple[int, int], str]] = {}
+
+
+def _fila_a_tarea(fila: tuple) -> Tarea:
+    """Convierte una fila de la tabla 'tareas' en una Tarea."""
+    id_, texto, completada, motivo, inhabilitada, lista, tema = fila
+    return Tarea(id_, texto, bool(completada), motivo, bool(inhabilitada), lista, tema)
+
+
+def _importar_json(conexion: sqlite3.Connection) -> None:
+    """
+    Importa las tareas del archivo JSON de versiones anteriores, si existe.
+    Se ejecuta dentro de la transacción que crea el esquema: si el archivo no
+    se puede leer o decodificar, la excepción deshace la transacción y no se
+    marca la base como migrada.
+    """
+    if not os.path.exists(RUTA_DATOS):
         return
+    with open(RUTA_DATOS, "rb") as f:
+        datos = orjson.loads(f.read())
 
     # Aseguramos estructura esperada
-    tareas = [
-        {
-            "id": int(t.get("id", 0)),
-            "texto": str(t.get("texto", "")),
-            "completada": bool(t.get("completada", False)),
-            "motivo": str(t.get("motivo", "")),
-            "inhabilitada": bool(t.get("inhabilitada", False)),
-            "lista": str(t.get("lista", "general")) or "general",
-            "tema": str(t.get("tema", "")),
-        }
+    filas = [
+        (
+            int(t.get("id", 0)),
+            str(t.get("texto", "")),
+            bool(t.get("completada", False)),
+            str(t.get("motivo", "")),
+            bool(t.get("inhabilitada", False)),
+            str(t.get("lista", "general")) or "general",
+            str(t.get("tema", "")),
+        )
         for t in datos
     ]
-    ultimo_id = max((t["id"] for t in tareas), default=0)
+    conexion.executemany(
+        f"INSERT OR REPLACE INTO tareas ({_COLUMNAS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        filas,
+    )
 
 
-def guardar_tareas() -> None:
-    """Guarda las tareas actuales en el archivo JSON."""
-    try:
-        with open(RUTA_DATOS, "w", encoding="utf-8") as f:
-            json.dump(tareas, f, ensure_ascii=False, indent=2)
-    except OSError:
-        # Para este ejemplo simple, sólo ignoramos errores de escritura.
-        pass
+def _crear_esquema(conexion: sqlite3.Connection) -> None:
+    """
+    Crea la tabla e importa el JSON en una sola transacción. Si la importación
+    falla no queda nada a medias y se reintenta en el próximo arranque.
+    """
+    # sqlite3 no abre transacciones implícitas para DDL: la abrimos a mano
+    conexion.execute("BEGIN")
+    with conexion:
+        conexion.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tareas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                texto TEXT NOT NULL,
+                completada INTEGER NOT NULL DEFAULT 0,
+                motivo TEXT NOT NULL DEFAULT '',
+                inhabilitada INTEGER NOT NULL DEFAULT 0,
+                lista TEXT NOT NULL DEFAULT 'general',
+                tema TEXT NOT NULL DEFAULT ''
+            )
+            """
+        )
+        conexion.execute("CREATE INDEX IF NOT EXISTS idx_lista ON tareas(lista)")
+        _importar_json(conexion)
+        conexion.execute(f"PRAGMA user_version = {VERSION_ESQUEMA}")
+
+
+def iniciar_db() -> None:
+    """Abre la base SQLite, crea el esquema y migra el JSON la primera vez."""
+    global _conexion, _version, _generacion
+    with _lock:
+        if _conexion is not None:
+            _conexion.close()
+        _conexion = sqlite3.connect(RUTA_DB, check_same_thread=False)
+        _generacion += 1
+        # WAL deja leer a las otras conexiones mientras se escribe; con WAL,
+        # NORMAL no arriesga corrupción
+        _conexion.execute("PRAGMA journal_mode=WAL")
+        _conexion.execute("PRAGMA synchronous=NORMAL")
+        if _conexion.execute("PRAGMA user_version").fetchone()[0] < VERSION_ESQUEMA:
+            _crear_esquema(_conexion)
+        _version += 1
+
+
+def _registrar_cambio() -> None:
+    """
+    Invalida los cachés tras una modificación. Llamar con _lock tomado y ya
+    confirmada la transacción: quien lea la versión nueva debe ver los datos nuevos.
+    """
+    global _version
+    _version += 1
 
 
-def obtener_listas() -> list[str]:
-    """Devuelve la lista de nombres de listas distintas."""
-    nombres = {t.get("lista", "general") or "general" for t in tareas}
-    if not nombres:
-        return ["general"]
+def _version_datos() -> tuple[int, int]:
+    """
+    Versión de los datos con la que se validan los cachés y el ETag.
+    PRAGMA data_version cambia cuando confirma otra conexión (por ejemplo, otro
+    proceso sobre la misma base); los cambios de este proceso los cuenta _version.
+    """
+    with _lock:
+        return _version, _conexion.execute("PRAGMA data_version").fetchone()[0]
+
+
+def _conexion_lectura() -> sqlite3.Connection:
+    """Devuelve la conexión de lectura del hilo actual, abriéndola si hace falta."""
+    if getattr(_lecturas, "generacion", None) != _generacion:
+        anterior = getattr(_lecturas, "conexion", None)
+        if anterior is not None:
+            anterior.close()
+        _lecturas.conexion = sqlite3.connect(RUTA_DB)
+        _lecturas.generacion = _generacion
+    return _lecturas.conexion
+
+
+@lru_cache(maxsize=1)
+def _obtener_listas_cacheado(version: tuple[int, int]) -> tuple[str, ...]:
+    """Nombres de listas para una versión dada de los datos."""
+    # Se resuelve recorriendo sólo el índice por lista
+    filas = _conexion_lectura().execute("SELECT DISTINCT lista FROM tareas")
+    nombres = {fila[0] for fila in filas}
     # Nos aseguramos de que siempre exista al menos 'general'
     nombres.add("general")
-    return sorted(nombres)
+    return tuple(sorted(nombres))
+
+
+def obtener_listas() -> list[str]:
+    """Devuelve la lista de nombres de listas distintas."""
+    return list(_obtener_listas_cacheado(_version_datos()))
 
 
 def construir_resumen_listas() -> list[dict]:
     """Construye un resumen con estadísticas de cada lista."""
-    resumen = []
-    for nombre in obtener_listas():
-        tareas_de_lista = [t for t in tareas if (t.get("lista", "general") or "general") == nombre]
-        total = len(tareas_de_lista)
-        activas = len([t for t in tareas_de_lista if not t.get("inhabilitada")])
-        completadas = len([t for t in tareas_de_lista if t.get("completada")])
-        # Tema: usamos el primer tema no vacío encontrado
-        tema = next((t.get("tema", "") for t in tareas_de_lista if t.get("tema")), "")
-        resumen.append(
-            {
-                "nombre": nombre,
-                "total": total,
-                "activas": activas,
-                "completadas": completadas,
-                "tema": tema,
-            }
-        )
-    return resumen
+    filas = _conexion_lectura().execute(
+        """
+        SELECT lista, COUNT(*), SUM(inhabilitada = 0), SUM(completada),
+               -- Tema: usamos el primer tema no vacío encontrado
+               COALESCE((SELECT tema FROM tareas AS t2
+                         WHERE t2.lista = t.lista AND t2.tema != ''
+                         ORDER BY t2.id LIMIT 1), '')
+        FROM tareas AS t
+        GROUP BY lista
+        """
+    ).fetchall()
+    por_nombre = {
+        lista: {
+            "nombre": lista,
+            "total": total,
+            "activas": activas,
+            "completadas": completadas,
+            "tema": tema,
+        }
+        for lista, total, activas, completadas, tema in filas
+    }
+    # Nos aseguramos de que siempre exista al menos 'general'
+    por_nombre.setdefault(
+        "general",
+        {"nombre": "general", "total": 0, "activas": 0, "completadas": 0, "tema": ""},
+    )
+    return [por_nombre[nombre] for nombre in sorted(por_nombre)]
 
 
 def obtener_tema_lista(nombre_lista: str) -> str:
     """Devuelve el tema de una lista (primer tema no vacío)."""
-    tareas_de_lista = [
-        t for t in tareas if (t.get("lista", "general") or "general") == nombre_lista
-    ]
-    return next((t.get("tema", "") for t in tareas_de_lista if t.get("tema")), "")
+    # Sin caché propio: la página completa ya se cachea por versión en render_tareas
+    fila = _conexion_lectura().execute(
+        "SELECT tema FROM tareas WHERE lista = ? AND tema != '' ORDER BY id LIMIT 1",
+        (nombre_lista,),
+    ).fetchone()
+    return fila[0] if fila else ""
+
+
+def obtener_tareas_de_lista(nombre_lista: str) -> list[Tarea]:
+    """Devuelve las tareas de una lista, en orden de creación."""
+    filas = _conexion_lectura().execute(
+        f"SELECT {_COLUMNAS} FROM tareas WHERE lista = ? ORDER BY id",
+        (nombre_lista,),
+    ).fetchall()
+    return [_fila_a_tarea(fila) for fila in filas]
+
 
+def _obtener_tarea(tarea_id: int) -> Tarea | None:
+    """Busca una tarea por id. Llamar con _lock tomado."""
+    fila = _conexion.execute(
+        f"SELECT {_COLUMNAS} FROM tareas WHERE id = ?", (tarea_id,)
+    ).fetchone()
+    return _fila_a_tarea(fila) if fila else None
 
-def agregar_tarea(texto: str, lista: str = "general") -> dict:
+
+def agregar_tarea(texto: str, lista: str = "general") -> Tarea:
     """
-    Agrega una tarea a la lista global.
+    Agrega una tarea a la lista indicada.
 
     :param texto: Descripción de la tarea.
     :return: La tarea creada con su id incremental.
     """
-    global ultimo_id
-    ultimo_id += 1
     lista_normalizada = lista or "general"
-    tarea = {
-        "id": ultimo_id,
-        "texto": texto,
-        "completada": False,
-        "motivo": "",
-        "inhabilitada": False,
-        "lista": lista_normalizada,
-        "tema": "",
-    }
-    tareas.append(tarea)
-    guardar_tareas()
-    return tarea
+    with _lock:
+        with _conexion:
+            cursor = _conexion.execute(
+                "INSERT INTO tareas (texto, lista) VALUES (?, ?)", (texto, lista_normalizada)
+            )
+        _registrar_cambio()
+    return Tarea(id=cursor.lastrowid, texto=texto, lista=lista_normalizada)
 
 
 def completar_tarea(tarea_id: int) -> bool:
@@ -121,83 +259,168 @@ def completar_tarea(tarea_id: int) -> bool:
     :param tarea_id: Id numérico de la tarea.
     :return: True si se encontró y completó, False en caso contrario.
     """
-    for tarea in tareas:
-        if tarea["id"] == tarea_id:
-            if tarea.get("inhabilitada"):
+    with _lock:
+        with _conexion:
+            tarea = _obtener_tarea(tarea_id)
+            if tarea is None or tarea.inhabilitada:
                 return False
-            tarea["completada"] = True
-            tarea["motivo"] = ""
-            guardar_tareas()
-            return True
-    return False
+            if tarea.completada and not tarea.motivo:
+                # Ya estaba completada: no hay nada que escribir
+                return True
+            _conexion.execute(
+                "UPDATE tareas SET completada = 1, motivo = '' WHERE id = ?", (tarea_id,)
+            )
+        _registrar_cambio()
+    return True
 
 
 def marcar_incompleta(tarea_id: int, motivo: str = "") -> bool:
     """
     Marca como incompleta la tarea y opcionalmente guarda un motivo.
     """
-    for tarea in tareas:
-        if tarea["id"] == tarea_id:
-            if tarea.get("inhabilitada"):
+    with _lock:
+        with _conexion:
+            tarea = _obtener_tarea(tarea_id)
+            if tarea is None or tarea.inhabilitada:
                 return False
-            tarea["completada"] = False
-            tarea["motivo"] = motivo
-            guardar_tareas()
-            return True
-    return False
+            if not tarea.completada and tarea.motivo == motivo:
+                return True
+            _conexion.execute(
+                "UPDATE tareas SET completada = 0, motivo = ? WHERE id = ?", (motivo, tarea_id)
+            )
+        _registrar_cambio()
+    return True
 
 
 def borrar_tarea(tarea_id: int) -> bool:
     """
     Marca una tarea como inhabilitada (borrado lógico) por su id.
     """
-    for tarea in tareas:
-        if tarea["id"] == tarea_id:
-            tarea["inhabilitada"] = True
-            guardar_tareas()
-            return True
-    return False
+    with _lock:
+        with _conexion:
+            tarea = _obtener_tarea(tarea_id)
+            if tarea is None:
+                return False
+            if tarea.inhabilitada:
+                return True
+            _conexion.execute("UPDATE tareas SET inhabilitada = 1 WHERE id = ?", (tarea_id,))
+        _registrar_cambio()
+    return True
 
 
 def create_app():
     """Aplicación Flask básica."""
     app = Flask(__name__)
 
-    # Cargar las tareas desde disco al iniciar la aplicación
-    cargar_tareas()
+    # Abrir la base de datos al iniciar la aplicación
+    iniciar_db()
+
+    # Compilamos las plantillas ahora para no hacerlo en la primera petición
+    app.jinja_env.get_template("listas.html")
+    app.jinja_env.get_template("index.html")
+
+    def usar_cache() -> bool:
+        """
+        Indica si se puede reutilizar HTML ya generado. Con recarga de plantillas
+        (modo debug) no, porque la plantilla puede cambiar sin que cambien los datos.
+        """
+        return not app.jinja_env.auto_reload
+
+    def responder_con_etag(generar_html) -> Response:
+        """
+        Responde 304 si el cliente ya tiene la versión actual de la página;
+        si no, genera el HTML. En ambos casos se envía el ETag.
+        """
+        if not usar_cache():
+            return app.make_response(generar_html())
+        version, version_externa = _version_datos()
+        etag = f"{_ID_INSTANCIA}-{version}-{version_externa}"
+        if request.if_none_match.contains_weak(etag):
+            respuesta = app.response_class(status=304)
+        else:
+            respuesta = app.make_response(generar_html())
+        respuesta.set_etag(etag, weak=True)
+        return respuesta
+
+    def stream_y_cachear(plantilla: str, al_terminar, **contexto) -> Response:
+        """
+        Envía la plantilla en streaming y, cuando termina de generarse,
+        pasa el HTML completo a 'al_terminar' para cachearlo.
+        """
+        partes_stream = stream_template(plantilla, **contexto)
+
+        def generar():
+            partes = []
+            try:
+                for parte in partes_stream:
+                    partes.append(parte)
+                    yield parte
+            finally:
+                # Libera el contexto de la petición aunque el cliente corte antes
+                partes_stream.close()
+            al_terminar("".join(partes))
+
+        return app.response_class(generar())
+
+    def render_listas() -> str | Response:
+        """Renderiza listas.html reutilizando el HTML si no hubo cambios."""
+        version = _version_datos()
+        cacheado = _cache_html_listas if usar_cache() else None
+        if cacheado is not None and cacheado[0] == version:
+            return cacheado[1]
+
+        def cachear(html: str) -> None:
+            global _cache_html_listas
+            _cache_html_listas = (version, html)
+
+        listas = construir_resumen_listas()
+        return stream_y_cachear("listas.html", cachear, listas=listas)
 
     @app.route("/")
     def index():
         """Página principal: listado de listas con estadísticas (ABM)."""
-        listas = construir_resumen_listas()
-        return render_template("listas.html", listas=listas)
+        return responder_con_etag(render_listas)
 
     @app.route("/listas")
     def vista_listas():
         """Alias de la vista principal de listas."""
-        listas = construir_resumen_listas()
-        return render_template("listas.html", listas=listas)
-
-    @app.route("/tareas")
-    def vista_tareas():
-        """Vista de tareas para una lista concreta."""
-        # Determina la lista actual a mostrar
-        lista_actual = request.args.get("lista", "general")
-        # Filtra tareas por lista
-        tareas_filtradas = [
-            t for t in tareas if (t.get("lista", "general") or "general") == lista_actual
-        ]
+        return responder_con_etag(render_listas)
+
+    def render_tareas(lista_actual: str) -> str | Response:
+        """Renderiza index.html para una lista, reutilizando el HTML si no hubo cambios."""
+        version = _version_datos()
+        cacheado = _cache_html_tareas.get(lista_actual) if usar_cache() else None
+        if cacheado is not None and cacheado[0] == version:
+            return cacheado[1]
+        # Si una escritura se cuela entre estas lecturas, el HTML queda guardado
+        # con una versión que ya no es la actual y no se vuelve a servir
+        tareas_filtradas = obtener_tareas_de_lista(lista_actual)
         listas = obtener_listas()
         tema_lista = obtener_tema_lista(lista_actual)
+
+        def cachear(html: str) -> None:
+            if len(_cache_html_tareas) >= MAX_VISTAS_CACHEADAS:
+                # Descartamos la entrada más antigua para acotar la memoria usada
+                _cache_html_tareas.pop(next(iter(_cache_html_tareas)), None)
+            _cache_html_tareas[lista_actual] = (version, html)
+
         # Renderiza la plantilla HTML pasando la lista de tareas y listas disponibles
-        return render_template(
+        return stream_y_cachear(
             "index.html",
+            cachear,
             tareas=tareas_filtradas,
             lista_actual=lista_actual,
             listas=listas,
             tema_lista=tema_lista,
         )
 
+    @app.route("/tareas")
+    def vista_tareas():
+        """Vista de tareas para una lista concreta."""
+        # Determina la lista actual a mostrar
+        lista_actual = request.args.get("lista", "general")
+        return responder_con_etag(lambda: render_tareas(lista_actual))
+
     @app.route("/agregar", methods=["POST"])
     def ruta_agregar_tarea():
         """Ruta para agregar una nueva tarea usando el formulario."""
@@ -241,10 +464,14 @@ def create_app():
         nuevo_nombre = request.form.get("nuevo_nombre", "").strip()
         if not nuevo_nombre or nuevo_nombre == lista_nombre:
             return redirect(url_for("vista_listas"))
-        for tarea in tareas:
-            if (tarea.get("lista", "general") or "general") == lista_nombre:
-                tarea["lista"] = nuevo_nombre
-        guardar_tareas()
+        with _lock:
+            with _conexion:
+                cursor = _conexion.execute(
+                    "UPDATE tareas SET lista = ? WHERE lista = ?", (nuevo_nombre, lista_nombre)
+                )
+            # Lista sin tareas: renombrarla no cambia nada
+            if cursor.rowcount:
+                _registrar_cambio()
         return redirect(url_for("vista_listas"))
 
     @app.route("/listas/eliminar/<lista_nombre>", methods=["POST"])
@@ -256,23 +483,26 @@ def create_app():
         if lista_nombre == "general":
             return redirect(url_for("vista_listas"))
 
-        global tareas
-        tareas = [
-            t
-            for t in tareas
-            if (t.get("lista", "general") or "general") != lista_nombre
-        ]
-        guardar_tareas()
+        with _lock:
+            with _conexion:
+                cursor = _conexion.execute("DELETE FROM tareas WHERE lista = ?", (lista_nombre,))
+            if cursor.rowcount:
+                _registrar_cambio()
         return redirect(url_for("vista_listas"))
 
     @app.route("/listas/tema/<lista_nombre>", methods=["POST"])
     def actualizar_tema_lista(lista_nombre: str):
         """Actualiza el tema de una lista (se guarda en cada tarea de esa lista)."""
         nuevo_tema = request.form.get("tema", "").strip()
-        for tarea in tareas:
-            if (tarea.get("lista", "general") or "general") == lista_nombre:
-                tarea["tema"] = nuevo_tema
-        guardar_tareas()
+        with _lock:
+            with _conexion:
+                # Sólo se tocan las tareas cuyo tema realmente cambia
+                cursor = _conexion.execute(
+                    "UPDATE tareas SET tema = ? WHERE lista = ? AND tema != ?",
+                    (nuevo_tema, lista_nombre, nuevo_tema),
+                )
+            if cursor.rowcount:
+                _registrar_cambio()
         return redirect(url_for("vista_listas"))
 
     return app